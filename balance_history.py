@@ -0,0 +1,150 @@
+import json
+import os
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Tuple, Optional, Iterable
+
+
+# 按地址存储的余额历史序列
+# 每个 (地址, 代币) 只保存余额发生变化的区块，区块号和余额都按差分编码：
+#   [第一个区块, 第一个余额, 区块差, 余额差, 区块差, 余额差, ...]
+# 文件格式为JSON Lines，第一行记录采样过的区块集合（多个地址、代币共享同一个集合），之后每行一个地址，
+# sampled 按代币记录已采样区块集合的编号，新加入配置的代币没有记录，所有区块都需要重新查询：
+#   {"block_sets": [[...], ...]}
+#   {"address": "0x...", "sampled": {"ETH": 0, "WETH": 0}, "series": {"ETH": [...], "WETH": [...]}}
+class BalanceHistory:
+    def __init__(self, path: str):
+        self.path = path
+        self.block_sets: List[List[int]] = []
+        self.sampled: Dict[str, Dict[str, int]] = {}
+        self.series: Dict[str, Dict[str, List[int]]] = {}
+        self._block_set_ids: Dict[Tuple[int, ...], int] = {}
+        # 解码后的序列缓存，键为 (地址, 代币)
+        self._decoded: Dict[Tuple[str, str], Tuple[List[int], List[int]]] = {}
+
+    def load(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'r') as f:
+            header = json.loads(f.readline())
+            for blocks in header.get("block_sets", []):
+                self._get_block_set_id(blocks)
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self.sampled[entry["address"]] = entry["sampled"]
+                self.series[entry["address"]] = entry["series"]
+
+    # 丢弃没有任何 (地址, 代币) 引用的区块集合，并重新编号
+    def _compact_block_sets(self):
+        remap: Dict[int, int] = {}
+        block_sets = []
+        for sampled in self.sampled.values():
+            for token, set_id in sampled.items():
+                if set_id not in remap:
+                    remap[set_id] = len(block_sets)
+                    block_sets.append(self.block_sets[set_id])
+                sampled[token] = remap[set_id]
+        self.block_sets = block_sets
+        self._block_set_ids = {tuple(blocks): set_id for set_id, blocks in enumerate(block_sets)}
+
+    # 原子写入历史文件，写入前清理不再引用的区块集合
+    def save(self):
+        self._compact_block_sets()
+        tmp_file = f"{self.path}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(json.dumps({"block_sets": self.block_sets}, separators=(',', ':')) + "\n")
+            for address, series in self.series.items():
+                entry = {"address": address, "sampled": self.sampled[address], "series": series}
+                f.write(json.dumps(entry, separators=(',', ':')) + "\n")
+        os.replace(tmp_file, self.path)
+
+    def _get_block_set_id(self, blocks: Iterable[int]) -> int:
+        key = tuple(sorted(blocks))
+        if key not in self._block_set_ids:
+            self._block_set_ids[key] = len(self.block_sets)
+            self.block_sets.append(list(key))
+        return self._block_set_ids[key]
+
+    # 某个 (地址, 代币) 已经采样过的区块
+    def sampled_blocks(self, address: str, token: str) -> List[int]:
+        set_id = self.sampled.get(address, {}).get(token)
+        if set_id is None:
+            return []
+        return self.block_sets[set_id]
+
+    # 某个 (地址, 代币) 还需要查询的区块
+    def missing_blocks(self, address: str, token: str, blocks: List[int]) -> List[int]:
+        known = self.sampled_blocks(address, token)
+        result = []
+        for block in blocks:
+            idx = bisect_left(known, block)
+            if idx >= len(known) or known[idx] != block:
+                result.append(block)
+        return result
+
+    @staticmethod
+    def encode(points: Iterable[Tuple[int, int]]) -> List[int]:
+        encoded = []
+        prev_block, prev_value = 0, 0
+        for block, value in points:
+            if encoded and value == prev_value:
+                continue
+            encoded.append(block - prev_block)
+            encoded.append(value - prev_value)
+            prev_block, prev_value = block, value
+        return encoded
+
+    @staticmethod
+    def decode(encoded: List[int]) -> Tuple[List[int], List[int]]:
+        blocks, values = [], []
+        block, value = 0, 0
+        for i in range(0, len(encoded), 2):
+            block += encoded[i]
+            value += encoded[i + 1]
+            blocks.append(block)
+            values.append(value)
+        return blocks, values
+
+    def _get_decoded(self, address: str, token: str) -> Tuple[List[int], List[int]]:
+        key = (address, token)
+        if key not in self._decoded:
+            encoded = self.series.get(address, {}).get(token, [])
+            self._decoded[key] = self.decode(encoded)
+        return self._decoded[key]
+
+    # 查询某个区块时的余额，早于第一个采样区块时返回None
+    def value_at(self, address: str, token: str, block: int) -> Optional[int]:
+        blocks, values = self._get_decoded(address, token)
+        idx = bisect_right(blocks, block) - 1
+        if idx < 0:
+            return None
+        return values[idx]
+
+    # 查询区块范围内的余额变化，返回起始区块的余额以及范围内的所有变化点
+    def range(self, address: str, token: str, start: int, end: int) -> List[Tuple[int, int]]:
+        blocks, values = self._get_decoded(address, token)
+        lo = bisect_right(blocks, start)
+        hi = bisect_right(blocks, end)
+        points = []
+        if lo > 0:
+            points.append((start, values[lo - 1]))
+        points.extend(zip(blocks[lo:hi], values[lo:hi]))
+        return points
+
+    # 合并新的采样结果；samples 为 {代币: {区块: 余额}}，只包含查询成功的区块
+    # 已采样区块上的值由原序列还原，再与新样本一起重新编码，保证未变化的区块不占空间
+    def record(self, address: str, samples: Dict[str, Dict[int, int]]):
+        series = self.series.setdefault(address, {})
+        sampled = self.sampled.setdefault(address, {})
+        for token, token_samples in samples.items():
+            known = self.sampled_blocks(address, token)
+            merged = {}
+            for block in known:
+                value = self.value_at(address, token, block)
+                if value is not None:
+                    merged[block] = value
+            merged.update(token_samples)
+            series[token] = self.encode(sorted(merged.items()))
+            self._decoded.pop((address, token), None)
+            sampled[token] = self._get_block_set_id(set(known) | set(token_samples))
@@ -0,0 +1,269 @@
+import asyncio
+from typing import List, Dict, Any, Tuple, Union
+
+# 通过 eth_call + state override 运行的余额扫描合约
+# 合约不需要部署：调用时把字节码覆盖到一个空地址上，一次调用返回一批地址的原生代币余额和所有代币余额
+#
+# 调用数据布局（每项32字节）：
+#   [地址数量 n][代币数量 t][地址1]...[地址n][代币1]...[代币t]
+# 返回数据为 n 行、每行 1 + t 列的矩阵：
+#   [地址1原生余额][地址1代币1余额]...[地址1代币t余额][地址2原生余额]...
+# 代币调用失败或返回数据不足32字节时，对应位置为0
+
+SCANNER_ADDRESS = "0x000000000000000000000000000000000000ba1a"
+
+# 每次 balanceOf 调用转发的gas上限，避免异常代币耗尽整个调用的gas
+TOKEN_CALL_GAS = 100000
+
+# 内存布局
+_MEM_N_ADDRESSES = 0x80
+_MEM_N_TOKENS = 0xa0
+_MEM_I = 0xc0
+_MEM_J = 0xe0
+_MEM_OUT_PTR = 0x100
+_MEM_CALL_INPUT = 0x120  # balanceOf(address) 调用数据，36字节
+_MEM_CALL_OUTPUT = 0x160
+_MEM_OUT_START = 0x180
+
+_OPCODES = {
+    "STOP": 0x00, "ADD": 0x01, "MUL": 0x02, "SUB": 0x03, "LT": 0x10, "GT": 0x11, "ISZERO": 0x15,
+    "AND": 0x16, "SHL": 0x1b, "BALANCE": 0x31, "CALLDATALOAD": 0x35, "RETURNDATASIZE": 0x3d,
+    "POP": 0x50, "MLOAD": 0x51, "MSTORE": 0x52, "JUMP": 0x56, "JUMPI": 0x57, "GAS": 0x5a,
+    "JUMPDEST": 0x5b, "DUP1": 0x80, "DUP5": 0x84, "RETURN": 0xf3, "STATICCALL": 0xfa,
+}
+
+
+def _push(value: int, size: int = None) -> Tuple[str, int, int]:
+    if size is None:
+        size = max(1, (value.bit_length() + 7) // 8)
+    return ("PUSH", value, size)
+
+
+# 简单的汇编器：支持操作码、PUSH 和跳转标签（标签固定用 PUSH2 引用）
+def _assemble(program: List[Union[str, Tuple]]) -> bytes:
+    labels = {}
+    offset = 0
+    for item in program:
+        if isinstance(item, tuple) and item[0] == "LABEL":
+            labels[item[1]] = offset
+            offset += 1  # JUMPDEST
+        elif isinstance(item, tuple) and item[0] == "PUSH":
+            offset += 1 + item[2]
+        elif isinstance(item, tuple) and item[0] == "REF":
+            offset += 3
+        else:
+            offset += 1
+
+    code = bytearray()
+    for item in program:
+        if isinstance(item, tuple) and item[0] == "LABEL":
+            code.append(_OPCODES["JUMPDEST"])
+        elif isinstance(item, tuple) and item[0] == "PUSH":
+            _, value, size = item
+            code.append(0x5f + size)
+            code += value.to_bytes(size, "big")
+        elif isinstance(item, tuple) and item[0] == "REF":
+            code.append(0x61)  # PUSH2
+            code += labels[item[1]].to_bytes(2, "big")
+        else:
+            code.append(_OPCODES[item])
+    return bytes(code)
+
+
+def _mload(slot: int) -> List:
+    return [_push(slot, 2), "MLOAD"]
+
+
+def _mstore(slot: int) -> List:
+    return [_push(slot, 2), "MSTORE"]
+
+
+def _increment(slot: int, amount: int) -> List:
+    return _mload(slot) + [_push(amount), "ADD"] + _mstore(slot)
+
+
+_SCANNER_PROGRAM = (
+    [_push(0x00), "CALLDATALOAD"] + _mstore(_MEM_N_ADDRESSES)
+    + [_push(0x20), "CALLDATALOAD"] + _mstore(_MEM_N_TOKENS)
+    + [_push(_MEM_OUT_START, 2)] + _mstore(_MEM_OUT_PTR)
+    + [_push(0)] + _mstore(_MEM_I)
+    # 外层循环：遍历地址
+    + [("LABEL", "outer")]
+    + _mload(_MEM_N_ADDRESSES) + _mload(_MEM_I) + ["LT", "ISZERO", ("REF", "end"), "JUMPI"]
+    # 地址 = calldata[0x40 + i * 32]
+    + _mload(_MEM_I) + [_push(5), "SHL", _push(0x40), "ADD", "CALLDATALOAD"]
+    # 原生代币余额
+    + ["DUP1", "BALANCE"] + _mload(_MEM_OUT_PTR) + ["MSTORE"]
+    + _increment(_MEM_OUT_PTR, 0x20)
+    # 准备 balanceOf(地址) 调用数据
+    + [_push(0x70a08231), _push(0xe0), "SHL"] + _mstore(_MEM_CALL_INPUT)
+    + _mstore(_MEM_CALL_INPUT + 4)
+    + [_push(0)] + _mstore(_MEM_J)
+    # 内层循环：遍历代币
+    + [("LABEL", "inner")]
+    + _mload(_MEM_N_TOKENS) + _mload(_MEM_J) + ["LT", "ISZERO", ("REF", "next"), "JUMPI"]
+    # 代币 = calldata[0x40 + (n + j) * 32]
+    + _mload(_MEM_N_ADDRESSES) + _mload(_MEM_J) + ["ADD", _push(5), "SHL", _push(0x40), "ADD", "CALLDATALOAD"]
+    + [_push(0)] + _mstore(_MEM_CALL_OUTPUT)
+    # staticcall(gas, 代币, input, 0x24, output, 0x20)
+    + [_push(0x20), _push(_MEM_CALL_OUTPUT, 2), _push(0x24), _push(_MEM_CALL_INPUT, 2), "DUP5",
+       _push(TOKEN_CALL_GAS), "STATICCALL"]
+    # 调用成功且返回至少32字节时取返回值，否则为0
+    + ["RETURNDATASIZE", _push(0x20), "GT", "ISZERO", "AND"]
+    + _mload(_MEM_CALL_OUTPUT) + ["MUL"]
+    + _mload(_MEM_OUT_PTR) + ["MSTORE", "POP"]
+    + _increment(_MEM_OUT_PTR, 0x20)
+    + _increment(_MEM_J, 1)
+    + [("REF", "inner"), "JUMP"]
+    + [("LABEL", "next")]
+    + _increment(_MEM_I, 1)
+    + [("REF", "outer"), "JUMP"]
+    # return(out_start, out_ptr - out_start)
+    + [("LABEL", "end")]
+    + [_push(_MEM_OUT_START, 2)] + _mload(_MEM_OUT_PTR) + ["SUB", _push(_MEM_OUT_START, 2), "RETURN"]
+)
+
+SCANNER_BYTECODE = "0x" + _assemble(_SCANNER_PROGRAM).hex()
+
+# 估算的每个地址gas消耗：冷账户BALANCE + 每个代币一次冷调用和存储读取
+GAS_PER_ADDRESS = 3000
+GAS_PER_TOKEN_CALL = 12000
+
+
+def encode_scan_calldata(addresses: List[str], tokens: List[str]) -> str:
+    words = [len(addresses), len(tokens)]
+    words += [int(addr, 16) for addr in addresses]
+    words += [int(token, 16) for token in tokens]
+    return "0x" + "".join(f"{word:064x}" for word in words)
+
+
+# 将返回的矩阵直接解码为整数数组，每行对应一个地址
+def decode_scan_result(result_hex: str, n_addresses: int, n_tokens: int) -> List[List[int]]:
+    data = bytes.fromhex(result_hex[2:] if result_hex.startswith("0x") else result_hex)
+    columns = 1 + n_tokens
+    if len(data) != n_addresses * columns * 32:
+        raise ValueError(f"返回数据长度不符: {len(data)}字节，预期{n_addresses * columns * 32}字节")
+    values = [int.from_bytes(data[k:k + 32], "big") for k in range(0, len(data), 32)]
+    return [values[row * columns:(row + 1) * columns] for row in range(n_addresses)]
+
+
+def _error_text(error: Any) -> str:
+    if isinstance(error, dict):
+        return f"{error.get('code', '')} {error.get('message', '')}".lower()
+    return str(error).lower()
+
+
+# 判断节点是否不支持 eth_call 的 state override 参数
+def is_override_unsupported(error: Any) -> bool:
+    text = _error_text(error)
+    if "gas" in text:
+        return False
+    return ("override" in text or "too many arguments" in text or "-32602" in text
+            or "invalid params" in text or "method not found" in text)
+
+
+# 判断错误是否由分块过大引起（gas不足、超出节点的gas或响应大小限制）
+def is_size_limit_error(error: Any) -> bool:
+    text = _error_text(error)
+    return ("gas" in text or "too large" in text or "size" in text or "limit" in text
+            or "out of memory" in text or "413" in text)
+
+
+# 自适应分块的余额扫描器
+# 成功时逐步增大分块，失败时将分块对半拆分重试；只有超出gas或响应限制时才不再超过失败时的大小，
+# 超时、连接断开等临时错误不影响分块上限；
+# 节点不支持 state override 时回退到逐个地址查询
+class BalanceScanner:
+    def __init__(self, rpc_manager, token_config: Dict, chunk_size: int = 500, max_chunk_size: int = 5000,
+                 gas_limit: int = 50000000, max_response_bytes: int = 10 * 1024 * 1024, concurrency: int = 4):
+        self.rpc_manager = rpc_manager
+        self.token_config = token_config
+        self.native_token = next((token for token in token_config if "address" not in token_config[token]), None)
+        self.tokens = [(symbol, info) for symbol, info in token_config.items() if "address" in info]
+        self.gas_limit = gas_limit
+        self.concurrency = concurrency
+        self.supported = True
+
+        # 按gas上限和响应大小（十六进制编码后每个值64字节）限制分块大小
+        columns = 1 + len(self.tokens)
+        gas_cap = gas_limit // (GAS_PER_ADDRESS + GAS_PER_TOKEN_CALL * len(self.tokens))
+        response_cap = max_response_bytes // (columns * 64)
+        self.max_chunk_size = max(1, min(max_chunk_size, gas_cap, response_cap))
+        self.chunk_size = max(1, min(chunk_size, self.max_chunk_size))
+
+    async def _call(self, addresses: List[str]) -> Dict:
+        data = encode_scan_calldata(addresses, [info["address"] for _, info in self.tokens])
+        return await self.rpc_manager.make_request(
+            "eth_call",
+            [{"to": SCANNER_ADDRESS, "data": data, "gas": hex(self.gas_limit)}, "latest",
+             {SCANNER_ADDRESS: {"code": SCANNER_BYTECODE}}]
+        )
+
+    def _format_row(self, address: str, row: List[int]) -> Dict[str, Any]:
+        result = {"address": address}
+        for token in self.token_config:
+            result[token] = "0"
+        if self.native_token:
+            result[self.native_token] = str(row[0] / 10**self.token_config[self.native_token]["decimals"])
+        for (symbol, info), balance in zip(self.tokens, row[1:]):
+            result[symbol] = str(balance / 10**info["decimals"])
+        return result
+
+    async def _fallback(self, addresses: List[str], fallback) -> List[Dict[str, Any]]:
+        return list(await asyncio.gather(*(fallback(addr) for addr in addresses)))
+
+    async def _scan_chunk(self, addresses: List[str], fallback) -> List[Dict[str, Any]]:
+        if not self.supported:
+            return await self._fallback(addresses, fallback)
+
+        response = await self._call(addresses)
+        error = response.get("error") if "result" not in response else None
+        if error is None and response["result"] in (None, "", "0x"):
+            # 节点忽略了state override时，对没有代码的地址调用返回空数据
+            print("节点忽略了state override（返回空数据），回退到逐个地址查询")
+            self.supported = False
+            return await self._fallback(addresses, fallback)
+        if error is None:
+            try:
+                rows = decode_scan_result(response["result"], len(addresses), len(self.tokens))
+            except ValueError as e:
+                error = str(e)
+
+        if error is None:
+            # 成功后逐步增大分块
+            if len(addresses) >= self.chunk_size:
+                self.chunk_size = min(self.max_chunk_size, self.chunk_size * 3 // 2 + 1)
+            return [self._format_row(addr, row) for addr, row in zip(addresses, rows)]
+
+        if is_override_unsupported(error):
+            print(f"节点不支持state override，回退到逐个地址查询: {error}")
+            self.supported = False
+            return await self._fallback(addresses, fallback)
+
+        if len(addresses) == 1:
+            return await self._fallback(addresses, fallback)
+
+        # 超出gas或响应大小限制时记住失败的大小；其他错误只缩小当前分块，成功后会重新增大
+        if is_size_limit_error(error):
+            self.max_chunk_size = max(1, min(self.max_chunk_size, len(addresses) - 1))
+        self.chunk_size = max(1, min(self.chunk_size, len(addresses) // 2))
+        print(f"扫描{len(addresses)}个地址失败，分块缩小到{self.chunk_size}: {error}")
+        half = len(addresses) // 2
+        return (await self._scan_chunk(addresses[:half], fallback)
+                + await self._scan_chunk(addresses[half:], fallback))
+
+    # 扫描一批地址，fallback 为单个地址的查询协程（如 get_balances）
+    async def scan(self, addresses: List[str], fallback) -> List[Dict[str, Any]]:
+        results: Dict[int, List[Dict[str, Any]]] = {}
+        cursor = 0
+
+        async def worker():
+            nonlocal cursor
+            while cursor < len(addresses):
+                start = cursor
+                chunk = addresses[start:start + self.chunk_size]
+                cursor += len(chunk)
+                results[start] = await self._scan_chunk(chunk, fallback)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return [row for start in sorted(results) for row in results[start]]
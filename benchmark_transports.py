@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import time
+from typing import List, Dict, Any
+
+from new_balance import NETWORK_CONFIGS, BALANCE_OF_SELECTOR
+from rpc_transports import create_transport, parse_node
+
+# 用于eth_call测试的地址
+SAMPLE_ADDRESS = "0x000000000004444c5dc75cB358380D2e3dE08A90"
+
+
+def build_payload(method: str, token_config: Dict, request_id: int) -> Dict:
+    if method == "eth_getBalance":
+        params = [SAMPLE_ADDRESS, "latest"]
+    elif method == "eth_call":
+        token = next(info for info in token_config.values() if "address" in info)
+        data = f"{BALANCE_OF_SELECTOR}{SAMPLE_ADDRESS[2:].lower().zfill(64)}"
+        params = [{"to": token["address"], "data": data}, "latest"]
+    else:
+        params = []
+    return {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+
+
+# 对单个节点发送固定数量的请求，统计延迟、吞吐量和客户端CPU占用
+async def benchmark_node(node, method: str, token_config: Dict, requests: int, concurrency: int) -> Dict[str, Any]:
+    transport = create_transport(node, concurrency)
+    await transport.start()
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(request_id: int):
+        nonlocal errors
+        async with semaphore:
+            payload = build_payload(method, token_config, request_id)
+            started = time.perf_counter()
+            try:
+                status, result = await transport.send(payload)
+                if status != 200 or "error" in result:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        # 预热，建立连接
+        await one(0)
+        latencies.clear()
+        errors = 0
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        await asyncio.gather(*(one(i) for i in range(1, requests + 1)))
+        cpu_time = time.process_time() - cpu_start
+        wall_time = time.perf_counter() - wall_start
+    finally:
+        await transport.close()
+
+    latencies.sort()
+    return {
+        "node": node,
+        "transport": parse_node(node)[0],
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "throughput": requests / wall_time if wall_time > 0 else 0.0,
+        "cpu_ms_per_1k": cpu_time * 1000 / requests * 1000,
+    }
+
+
+def print_results(results: List[Dict[str, Any]]):
+    baseline = next((r for r in results if r["transport"] == "http"), results[0])
+    print(f"{'传输':<6}{'P50(ms)':>10}{'P99(ms)':>10}{'请求/秒':>12}{'CPU(ms/千次)':>16}{'CPU对比HTTP':>14}{'错误':>8}  节点")
+    for r in results:
+        cpu_ratio = r["cpu_ms_per_1k"] / baseline["cpu_ms_per_1k"] if baseline["cpu_ms_per_1k"] else 0.0
+        print(f"{r['transport']:<6}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['throughput']:>12.0f}"
+              f"{r['cpu_ms_per_1k']:>16.1f}{cpu_ratio:>13.2f}x{r['errors']:>8}  {r['node']}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='比较HTTP、WebSocket和IPC传输的延迟与CPU开销')
+    parser.add_argument('--nodes', type=str, nargs='+', default=None,
+                      help='要测试的节点，例如 http://host:8545 ws://host:8546 /path/geth.ipc (默认: 网络配置中的节点)')
+    parser.add_argument('--network', type=str, default='ethereum',
+                      choices=NETWORK_CONFIGS.keys(),
+                      help='网络 (默认: ethereum)')
+    parser.add_argument('--method', type=str, default='eth_getBalance',
+                      choices=['eth_blockNumber', 'eth_getBalance', 'eth_call'],
+                      help='测试使用的RPC方法 (默认: eth_getBalance)')
+    parser.add_argument('--requests', type=int, default=5000,
+                      help='每个节点的请求数 (默认: 5000)')
+    parser.add_argument('--concurrency', type=int, default=100,
+                      help='并发请求数 (默认: 100)')
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_arguments()
+    network_config = NETWORK_CONFIGS[args.network]
+    nodes = args.nodes or network_config["rpc_nodes"]
+
+    results = []
+    for node in nodes:
+        print(f"测试节点: {node}")
+        results.append(await benchmark_node(node, args.method, network_config["tokens"],
+                                            args.requests, args.concurrency))
+    print_results(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+import asyncio
+import csv
+import os
+from typing import List, Dict, Tuple
+
+from web3 import Web3
+
+from resume_index import normalize_address
+
+# 空字节码的keccak256，代码哈希等于该值的地址为EOA
+EMPTY_CODE_HASH = "0xc5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470"
+
+CLASSIFY_FIELDS = ['is_contract', 'code_hash']
+
+
+def hash_code(code: str) -> str:
+    if not code or code == "0x":
+        return EMPTY_CODE_HASH
+    return Web3.to_hex(Web3.keccak(hexstr=code))
+
+
+# 合约/EOA分类器
+# 以地址（统一为0x小写格式）为键缓存代码哈希，缓存文件只追加新地址；相同字节码（代理、克隆合约）按代码哈希合并统计
+# 只缓存有代码的地址：EOA之后可能获得代码（CREATE2预计算地址部署、EIP-7702委托），每次都重新查询
+# 默认用eth_getCode：大多数地址是EOA，只返回"0x"；合约的字节码只在第一次查询时下载，之后走缓存。
+# eth_getProof不返回字节码，但每个地址都会返回数KB的账户证明，节点还要构造trie证明，
+# 只在合约占比高、字节码很大时才可能更省流量
+class CodeClassifier:
+    def __init__(self, cache_file: str = 'code_cache.csv', method: str = 'eth_getCode', batch_size: int = 100):
+        if method not in ('eth_getCode', 'eth_getProof'):
+            raise ValueError(f"不支持的查询方法: {method}")
+        self.cache_file = cache_file
+        self.method = method
+        self.batch_size = batch_size
+        self.address_hashes: Dict[str, str] = {}
+        # 代码哈希 -> [代码大小, 地址数量]
+        self.code_hashes: Dict[str, List[int]] = {}
+        self._unsaved: List[Tuple[str, str]] = []
+
+    def load(self):
+        if not os.path.exists(self.cache_file) or os.path.getsize(self.cache_file) == 0:
+            return
+        with open(self.cache_file, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                # 旧缓存中可能有EOA记录，或同一地址带/不带0x前缀的两条记录
+                if row['code_hash'] == EMPTY_CODE_HASH:
+                    continue
+                try:
+                    key = normalize_address(row['address'])
+                except ValueError:
+                    continue
+                if key in self.address_hashes:
+                    continue
+                self.address_hashes[key] = row['code_hash']
+                entry = self.code_hashes.setdefault(row['code_hash'], [int(row['code_size'] or 0), 0])
+                entry[1] += 1
+
+    # 将新分类的地址追加到缓存文件
+    def save(self):
+        if not self._unsaved:
+            return
+        file_exists = os.path.exists(self.cache_file) and os.path.getsize(self.cache_file) > 0
+        with open(self.cache_file, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if not file_exists:
+                writer.writerow(['address', 'code_hash', 'code_size'])
+            for address, code_hash in self._unsaved:
+                writer.writerow([address, code_hash, self.code_hashes[code_hash][0]])
+        self._unsaved = []
+
+    # 记录查询结果并返回分类信息，EOA不写入缓存
+    def record(self, address: str, code_hash: str, code_size: int) -> Dict[str, str]:
+        key = normalize_address(address)
+        if code_hash != EMPTY_CODE_HASH and key not in self.address_hashes:
+            self.address_hashes[key] = code_hash
+            entry = self.code_hashes.setdefault(code_hash, [code_size, 0])
+            entry[1] += 1
+            self._unsaved.append((key, code_hash))
+        return self._info(code_hash)
+
+    # 查询缓存，未缓存（包括EOA）时返回空值
+    def lookup(self, address: str) -> Dict[str, str]:
+        code_hash = self.address_hashes.get(normalize_address(address))
+        if code_hash is None:
+            return {'is_contract': '', 'code_hash': ''}
+        return self._info(code_hash)
+
+    @staticmethod
+    def _info(code_hash: str) -> Dict[str, str]:
+        return {'is_contract': str(code_hash != EMPTY_CODE_HASH), 'code_hash': code_hash}
+
+    def _build_call(self, address: str) -> Tuple[str, List]:
+        if self.method == 'eth_getProof':
+            return 'eth_getProof', [address, [], "latest"]
+        return 'eth_getCode', [address, "latest"]
+
+    def _parse_response(self, response: Dict) -> Tuple[str, int]:
+        result = response["result"]
+        if self.method == 'eth_getProof':
+            # getProof不返回字节码，代码大小未知；不存在的账户可能返回全0哈希
+            code_hash = result["codeHash"]
+            if int(code_hash, 16) == 0:
+                code_hash = EMPTY_CODE_HASH
+            return code_hash, 0
+        return hash_code(result), max(0, (len(result) - 2) // 2)
+
+    # 分类一批地址，未缓存的地址通过JSON-RPC批量请求查询
+    async def classify(self, addresses: List[str], rpc_manager, error_log: str = None) -> Dict[str, Dict[str, str]]:
+        results = {normalize_address(addr): self.lookup(addr) for addr in addresses}
+        # 按统一格式的地址去重，大小写、前缀不同的同一地址只查询一次
+        missing = [key for key, info in results.items() if not info['code_hash']]
+        chunks = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+
+        async def classify_chunk(chunk):
+            responses = await rpc_manager.make_batch_request([self._build_call(addr) for addr in chunk])
+            for addr, response in zip(chunk, responses):
+                if "result" not in response or response.get("error"):
+                    if error_log:
+                        with open(error_log, "a") as error_file:
+                            error_file.write(f"地址 {addr} 分类出错: {response.get('error')}\n")
+                    continue
+                code_hash, code_size = self._parse_response(response)
+                results[addr] = self.record(addr, code_hash, code_size)
+
+        await asyncio.gather(*(classify_chunk(chunk) for chunk in chunks))
+        self.save()
+        return {addr: results[normalize_address(addr)] for addr in addresses}
@@ -1,4 +1,5 @@
 from web3 import Web3
+from rpc_transports import make_web3_provider
 import csv
 from datetime import datetime
 import threading
@@ -7,7 +8,7 @@ import time
 
 # 连接到以太坊主网
 eth = "http://192.168.31.100:8547" # Alchemy免费节点
-web3 = Web3(Web3.HTTPProvider(eth))
+web3 = Web3(make_web3_provider(eth))  # 支持 http://、ws:// 和 IPC 路径
 
 # WETH合约地址和ABI
 WETH_ADDRESS = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
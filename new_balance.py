@@ -4,14 +4,21 @@ import csv
 import time
 import argparse
 import os
-from typing import List, Dict, Any, Set
-import aiohttp
+from itertools import islice
+from typing import List, Dict, Any, Set, Tuple, Iterable, Iterator, Container
 from web3 import Web3
 import sys
 
+from balance_history import BalanceHistory
+from balance_scanner import BalanceScanner
+from code_classifier import CodeClassifier, CLASSIFY_FIELDS
+from resume_index import ResumeIndex
+from rpc_transports import NodeConfig, create_transport
+
 # 不同网络的代币合约地址配置
 NETWORK_CONFIGS = {
     "ethereum": {
+        # 节点也可以写成 {"url": "/data/geth/geth.ipc", "transport": "ipc"} 或 "ws://192.168.31.100:8548"
         "rpc_nodes": [
             "http://192.168.31.100:8547",
         ],
@@ -79,31 +86,35 @@ BALANCE_OF_SELECTOR = "0x70a08231"  # balanceOf(address)
 # 批处理和并发设置
 BATCH_SIZE = 1000  # 每批处理的地址数量
 MAX_CONCURRENT_REQUESTS = 100  # 最大并发请求数
+RPC_BATCH_SIZE = 100  # 历史模式和合约分类中每个JSON-RPC批量请求包含的调用数量
+REFRESHED_AT_FIELD = 'refreshed_at'  # 输出CSV中记录刷新时间（Unix秒）的列
+SCANNER_CHUNK_SIZE = 500  # 扫描合约每次调用的初始地址数量
+SCANNER_GAS_LIMIT = 50000000  # 扫描合约每次调用的gas上限（geth默认RPC gas上限）
 
 # 连接池和节点选择器
 class RPCManager:
-    def __init__(self, rpc_urls: List[str], max_connections: int = 100):
+    def __init__(self, rpc_urls: List[NodeConfig], max_connections: int = 100):
         self.rpc_urls = rpc_urls
         self.current_idx = 0
-        self.session = None
         self.max_connections = max_connections
+        # 每个节点一个传输，按配置选择HTTP、WebSocket或IPC
+        self.transports = [create_transport(node, max_connections) for node in rpc_urls]
         
     async def init_session(self):
-        # 创建一个共享的会话，设置最大连接数
-        connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
-        self.session = aiohttp.ClientSession(connector=connector)
+        for transport in self.transports:
+            await transport.start()
         
     async def close_session(self):
-        if self.session:
-            await self.session.close()
+        for transport in self.transports:
+            await transport.close()
     
-    def get_next_url(self):
-        url = self.rpc_urls[self.current_idx]
-        self.current_idx = (self.current_idx + 1) % len(self.rpc_urls)
-        return url
+    def get_next_transport(self):
+        transport = self.transports[self.current_idx]
+        self.current_idx = (self.current_idx + 1) % len(self.transports)
+        return transport
     
     async def make_request(self, method: str, params: List) -> Dict:
-        url = self.get_next_url()
+        transport = self.get_next_transport()
         payload = {
             "jsonrpc": "2.0",
             "id": int(time.time() * 1000),
@@ -112,26 +123,50 @@ class RPCManager:
         }
         
         try:
-            async with self.session.post(url, json=payload) as response:
-
-                print("请求URL:", url)
-                print("请求数据:", payload)
-                print("响应状态:", response.status)
-                if response.status == 429:  # 处理请求过多的错误
-                    print("请求过多，等待重试...")
-                    await asyncio.sleep(5)  # 等待后重试
-                    return await self.make_request(method, params)
-                
-                if response.status != 200:
-                    return {"error": f"HTTP错误 {response.status}"}
-                
-                result = await response.json()
-                if "error" in result:
-                    return {"error": result["error"]}                    
-                return result
+            status, result = await transport.send(payload)
+
+            print("请求URL:", transport.url)
+            print("请求数据:", payload)
+            print("响应状态:", status)
+            if status == 429:  # 处理请求过多的错误
+                print("请求过多，等待重试...")
+                await asyncio.sleep(5)  # 等待后重试
+                return await self.make_request(method, params)
+            
+            if status != 200:
+                return {"error": f"HTTP错误 {status}"}
+            
+            if "error" in result:
+                return {"error": result["error"]}                    
+            return result
         except Exception as e:
             return {"error": str(e)}
 
+    async def make_batch_request(self, calls: List[Tuple[str, List]]) -> List[Dict]:
+        # 将多个调用合并为一个JSON-RPC批量请求，返回结果与calls顺序一致
+        transport = self.get_next_transport()
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, (method, params) in enumerate(calls)
+        ]
+
+        try:
+            status, result = await transport.send(payload)
+            if status == 429:
+                print("请求过多，等待重试...")
+                await asyncio.sleep(5)
+                return await self.make_batch_request(calls)
+
+            if status != 200:
+                return [{"error": f"HTTP错误 {status}"}] * len(calls)
+
+            if isinstance(result, dict):  # 节点对整个批量请求返回了单个错误
+                return [{"error": result.get("error", result)}] * len(calls)
+            by_id = {item.get("id"): item for item in result}
+            return [by_id.get(i, {"error": "缺少响应"}) for i in range(len(calls))]
+        except Exception as e:
+            return [{"error": str(e)}] * len(calls)
+
 # 获取地址的原生代币余额和其他代币余额
 async def get_balances(address: str, rpc_manager: RPCManager, token_config: Dict) -> Dict[str, Any]:
     # 确定原生代币（ETH, MATIC等）基于代币配置
@@ -181,29 +216,38 @@ async def get_balances(address: str, rpc_manager: RPCManager, token_config: Dict
             error_file.write(f"地址 {address} 出错: {str(e)}\n")
         return result
 
-# 从CSV获取已经处理过的地址
-def get_processed_addresses_from_csv(output_file: str) -> Set[str]:
-    processed = set()
-    if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
-        try:
-            with open(output_file, 'r', newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    processed.add(row['address'])
-        except Exception as e:
-            print(f"读取已处理地址时出错: {e}")
-    return processed
+# 输出CSV的列：地址、各代币余额、可选的附加列，以及刷新时间
+def get_fieldnames(token_config: Dict, extra_fields: List[str] = None) -> List[str]:
+    return ['address'] + list(token_config.keys()) + (extra_fields or []) + [REFRESHED_AT_FIELD]
+
+# 检查已有输出文件的表头，缺少本次需要写入的列时报错，而不是静默丢弃这些列
+def check_output_header(file_path: str, fieldnames: List[str]):
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return
+    with open(file_path, 'r', newline='') as csvfile:
+        header = next(csv.reader(csvfile), [])
+    missing = [field for field in fieldnames if field not in header]
+    if missing:
+        raise ValueError(f"输出文件 {file_path} 的表头缺少列: {', '.join(missing)}；"
+                         f"请使用新的--output（和--progress-file），或加--restart重新开始")
 
 # 将结果写入CSV文件
-def write_to_csv(results: List[Dict], file_path: str, token_config: Dict, append: bool = False):
+def write_to_csv(results: List[Dict], file_path: str, token_config: Dict, append: bool = False,
+                 extra_fields: List[str] = None):
     if not results:  # 如果没有结果，则跳过写入
         return
 
     mode = 'a' if append else 'w'
     file_exists = os.path.exists(file_path) and os.path.getsize(file_path) > 0
     
+    fieldnames = get_fieldnames(token_config, extra_fields)
+    if append and file_exists:
+        # 追加时沿用已有文件的列顺序，表头必须包含所有要写入的列
+        check_output_header(file_path, fieldnames)
+        with open(file_path, 'r', newline='') as csvfile:
+            fieldnames = next(csv.reader(csvfile))
+    
     with open(file_path, mode, newline='') as csvfile:
-        fieldnames = ['address'] + list(token_config.keys())
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         
         if not append or not file_exists:
@@ -212,6 +256,139 @@ def write_to_csv(results: List[Dict], file_path: str, token_config: Dict, append
         for result in results:
             writer.writerow(result)
 
+# 流式读取地址文件：逐行校验并跳过已处理的地址，同时记录读取进度
+class AddressStream:
+    def __init__(self, path: str, processed_addresses: Container[str] = None, error_log: str = None):
+        self.path = path
+        self.processed_addresses = processed_addresses if processed_addresses is not None else set()
+        self.error_log = error_log
+        self.total_bytes = os.path.getsize(path)
+        self.bytes_read = 0
+        self.skipped = 0
+        self.invalid = 0
+
+    def __iter__(self) -> Iterator[str]:
+        with open(self.path, 'rb') as f:
+            for raw in f:
+                self.bytes_read += len(raw)
+                addr = raw.decode('utf-8', errors='replace').strip()
+                if not addr:
+                    continue
+                if not Web3.is_address(addr):
+                    self.invalid += 1
+                    if self.error_log:
+                        with open(self.error_log, "a") as error_file:
+                            error_file.write(f"无效地址: {addr}\n")
+                    continue
+                if addr in self.processed_addresses:
+                    self.skipped += 1
+                    continue
+                yield addr
+
+    def progress(self) -> float:
+        return self.bytes_read / self.total_bytes if self.total_bytes > 0 else 1.0
+
+# 将可迭代对象按固定大小切分为批次
+def iter_batches(iterable: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+# 解析历史模式的区块列表：--blocks 1,2,3 或 --block-range start:end:step
+def parse_blocks(blocks_arg: str, range_arg: str) -> List[int]:
+    blocks = set()
+    if blocks_arg:
+        for block in blocks_arg.split(','):
+            if block.strip():
+                blocks.add(int(block.strip(), 0))
+    if range_arg:
+        parts = [int(part, 0) for part in range_arg.split(':')]
+        if len(parts) != 3 or parts[2] <= 0:
+            raise ValueError(f"无效的区块范围: {range_arg}，格式应为 start:end:step")
+        start, end, step = parts
+        blocks.update(range(start, end + 1, step))
+    if not blocks:
+        raise ValueError("历史模式没有得到任何区块，请检查--blocks和--block-range参数")
+    return sorted(blocks)
+
+# 构造 (地址, 代币, 区块) 对应的RPC调用
+def build_balance_call(address: str, token_info: Dict, block: int) -> Tuple[str, List]:
+    if "address" not in token_info:
+        return "eth_getBalance", [address, hex(block)]
+    address_param = address[2:].lower().zfill(64)
+    data = f"{BALANCE_OF_SELECTOR}{address_param}"
+    return "eth_call", [{"to": token_info["address"], "data": data}, hex(block)]
+
+# 查询一批地址在多个区块的余额，并合并到历史序列中
+async def process_history_batch(addresses: List[str], rpc_manager: RPCManager, token_config: Dict,
+                                history: BalanceHistory, blocks: List[int], rpc_batch_size: int) -> int:
+    # 按 (地址, 代币, 区块) 调度，已经在历史文件中采样过的直接复用
+    keys = []
+    calls = []
+    for address in addresses:
+        for token_symbol, token_info in token_config.items():
+            for block in history.missing_blocks(address, token_symbol, blocks):
+                keys.append((address, token_symbol, block))
+                calls.append(build_balance_call(address, token_info, block))
+
+    if not calls:
+        return 0
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def send_chunk(chunk):
+        async with semaphore:
+            return await rpc_manager.make_batch_request(chunk)
+
+    chunks = [calls[i:i + rpc_batch_size] for i in range(0, len(calls), rpc_batch_size)]
+    responses = []
+    for chunk_responses in await asyncio.gather(*(send_chunk(chunk) for chunk in chunks)):
+        responses.extend(chunk_responses)
+
+    samples: Dict[str, Dict[str, Dict[int, int]]] = {}
+    for (address, token_symbol, block), response in zip(keys, responses):
+        if "result" not in response or response.get("error"):
+            with open(args.error_log, "a") as error_file:
+                error_file.write(f"地址 {address} 代币 {token_symbol} 区块 {block} 出错: {response.get('error')}\n")
+            continue
+        value_hex = response["result"]
+        value = int(value_hex, 16) if value_hex and value_hex != "0x" else 0
+        samples.setdefault(address, {}).setdefault(token_symbol, {})[block] = value
+
+    # 只记录查询成功的 (代币, 区块)，失败的下次运行时会重新查询
+    for address, address_samples in samples.items():
+        history.record(address, address_samples)
+    return len(calls)
+
+# 历史模式：查询地址列表在一系列区块的余额
+async def run_history(addresses_file: str, rpc_manager: RPCManager, token_config: Dict, blocks: List[int],
+                      history_file: str, rpc_batch_size: int):
+    history = BalanceHistory(history_file)
+    history.load()
+    print(f"历史模式: {len(blocks)}个区块，已有{len(history.series)}个地址的历史记录")
+    # 中断时也会保存已完成的部分，重跑只会查询尚未采样的 (地址, 区块)
+
+    address_stream = AddressStream(addresses_file)
+    start_time = time.time()
+    total_addresses = 0
+    total_calls = 0
+    try:
+        for batch_addresses in iter_batches(address_stream, BATCH_SIZE):
+            total_calls += await process_history_batch(
+                batch_addresses, rpc_manager, token_config, history, blocks, rpc_batch_size
+            )
+            total_addresses += len(batch_addresses)
+            elapsed = time.time() - start_time
+            print(f"历史模式已处理: {total_addresses}个地址, 文件进度: {address_stream.progress() * 100:.1f}%, "
+                  f"RPC调用: {total_calls}, 已用时间: {elapsed:.1f}秒")
+    finally:
+        history.save()
+
+    print(f"历史模式完成！结果已保存到{history_file}")
+
 # 处理一批地址
 async def process_batch(addresses: List[str], rpc_manager: RPCManager, token_config: Dict, 
                        processed_addresses: Set[str], output_file: str, progress_file: str) -> List[Dict]:
@@ -262,6 +439,28 @@ def parse_arguments():
                       help='重新开始，覆盖现有输出文件')
     parser.add_argument('--progress-file', type=str, default='progress.txt',
                       help='进度文件的路径 (默认: progress.txt)')
+    parser.add_argument('--blocks', type=str, default=None,
+                      help='历史模式：逗号分隔的区块号列表')
+    parser.add_argument('--block-range', type=str, default=None,
+                      help='历史模式：区块范围，格式为 start:end:step')
+    parser.add_argument('--history-output', type=str, default='history.jsonl',
+                      help='历史模式输出文件的路径 (默认: history.jsonl)')
+    parser.add_argument('--scanner', action='store_true',
+                      help='通过state override运行余额扫描合约，一次eth_call查询一块地址的所有余额')
+    parser.add_argument('--scanner-chunk-size', type=int, default=SCANNER_CHUNK_SIZE,
+                      help=f'扫描合约每次调用的初始地址数量，会根据节点限制自动调整 (默认: {SCANNER_CHUNK_SIZE})')
+    parser.add_argument('--gas-limit', type=int, default=SCANNER_GAS_LIMIT,
+                      help=f'扫描合约每次调用的gas上限，应不超过节点的RPC gas上限 (默认: {SCANNER_GAS_LIMIT})')
+    parser.add_argument('--classify', action='store_true',
+                      help='同时查询地址代码，在输出中添加is_contract和code_hash列')
+    parser.add_argument('--classify-method', type=str, default='eth_getCode',
+                      choices=['eth_getCode', 'eth_getProof'],
+                      help='合约分类使用的RPC方法；eth_getProof不返回字节码，但每个地址都带有数KB的账户证明 '
+                           '(默认: eth_getCode)')
+    parser.add_argument('--code-cache', type=str, default='code_cache.csv',
+                      help='地址代码哈希缓存文件的路径 (默认: code_cache.csv)')
+    parser.add_argument('--rpc-batch-size', type=int, default=RPC_BATCH_SIZE,
+                      help=f'历史模式和合约分类中每个JSON-RPC批量请求的调用数量 (默认: {RPC_BATCH_SIZE})')
     
     if len(sys.argv) == 1:
         parser.print_help()
@@ -269,28 +468,17 @@ def parse_arguments():
         
     return parser.parse_args()
 
-# 从进度文件获取已处理的地址
-def get_processed_addresses_from_progress(progress_file: str) -> Set[str]:
-    processed = set()
-    if os.path.exists(progress_file) and os.path.getsize(progress_file) > 0:
-        try:
-            with open(progress_file, 'r') as file:
-                for line in file:
-                    processed.add(line.strip())
-        except Exception as e:
-            print(f"读取进度文件时出错: {e}")
-    return processed
-
 # 将地址写入进度文件
 def write_address_to_progress(address: str, progress_file: str):
     with open(progress_file, 'a') as file:
         file.write(f"{address}\n")
 
 # 处理一批地址
-async def process_batch(addresses: List[str], rpc_manager: RPCManager, token_config: Dict, 
-                       processed_addresses: Set[str], output_file: str, progress_file: str) -> List[Dict]:
-    results = []
-    pending_tasks = []
+# 地址已由AddressStream校验并过滤掉已处理的地址，这里只去掉同一批次内的重复地址
+async def process_batch(addresses: List[str], rpc_manager: RPCManager, token_config: Dict,
+                       output_file: str, progress_file: str,
+                       scanner: BalanceScanner = None, classifier: CodeClassifier = None) -> List[Dict]:
+    pending_addresses = list({addr.lower(): addr for addr in addresses}.values())
     
     # 控制并发请求数量
     semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
@@ -299,28 +487,36 @@ async def process_batch(addresses: List[str], rpc_manager: RPCManager, token_con
         async with semaphore:
             return await get_balances(addr, rpc_manager, token_config)
     
-    # 创建所有查询任务
-    for addr in addresses:
-        if not Web3.is_address(addr):
-            with open(args.error_log, "a") as error_file:
-                error_file.write(f"无效地址: {addr}\n")
-            continue
-        
-        if addr in processed_addresses:
-            print(f"跳过已处理的地址: {addr}")
-            continue
-        
-        pending_tasks.append(get_balance_with_semaphore(addr))
-    
     # 如果没有待处理任务，直接返回空结果
-    if not pending_tasks:
+    if not pending_addresses:
         return []
     
-    # 等待所有任务完成
-    results = await asyncio.gather(*pending_tasks)
+    async def fetch_balances():
+        if scanner:
+            # 扫描合约一次调用查询一整块地址，不支持时逐个地址回退
+            return await scanner.scan(pending_addresses, get_balance_with_semaphore)
+        pending_tasks = [get_balance_with_semaphore(addr) for addr in pending_addresses]
+        # 等待所有任务完成
+        return await asyncio.gather(*pending_tasks)
+
+    if classifier:
+        # 合约分类与余额查询并发进行，不需要单独再扫描一遍
+        results, classifications = await asyncio.gather(
+            fetch_balances(), classifier.classify(pending_addresses, rpc_manager, args.error_log)
+        )
+        for result in results:
+            result.update(classifications[result["address"]])
+    else:
+        results = await fetch_balances()
+
+    # 记录每个地址的刷新时间，供refresh_scheduler.py按地址计算陈旧度
+    refreshed_at = int(time.time())
+    for result in results:
+        result[REFRESHED_AT_FIELD] = refreshed_at
 
     # 将结果写入CSV文件
-    write_to_csv(results, output_file, token_config, append=True)
+    write_to_csv(results, output_file, token_config, append=True,
+                 extra_fields=CLASSIFY_FIELDS if classifier else None)
 
     # 写入进度文件
     for result in results:
@@ -347,26 +543,37 @@ async def main():
     await rpc_manager.init_session()
     
     try:
-        # 读取地址文件
-        with open(args.addresses, 'r') as f:
-            all_addresses = [addr.strip() for addr in f.readlines()]
-        
-        valid_addresses = [addr for addr in all_addresses if Web3.is_address(addr)]
-        
-        # 获取已处理的地址（如果是续传模式）
-        processed_addresses = set()
-        if args.resume and not args.restart:
-            processed_addresses = get_processed_addresses_from_csv(args.output)
-            print(f"找到{len(processed_addresses)}个已处理的地址")
-        
-        # 从进度文件获取已处理的地址
-        processed_addresses.update(get_processed_addresses_from_progress(args.progress_file))
-        
+        # 历史模式：只要指定了区块参数就进入，解析不出区块时报错，不会退回最新余额扫描
+        if args.blocks is not None or args.block_range is not None:
+            try:
+                blocks = parse_blocks(args.blocks, args.block_range)
+            except ValueError as e:
+                print(e)
+                sys.exit(1)
+            await run_history(args.addresses, rpc_manager, token_config, blocks,
+                              args.history_output, args.rpc_batch_size)
+            return
+
+        # 扫描合约模式
+        scanner = None
+        if args.scanner:
+            scanner = BalanceScanner(rpc_manager, token_config, chunk_size=args.scanner_chunk_size,
+                                     gas_limit=args.gas_limit)
+            print(f"使用扫描合约，初始分块: {scanner.chunk_size}，最大分块: {scanner.max_chunk_size}")
+
+        # 合约/EOA分类
+        classifier = None
+        if args.classify:
+            classifier = CodeClassifier(args.code_cache, args.classify_method, args.rpc_batch_size)
+            classifier.load()
+            print(f"合约分类已启用，缓存中有{len(classifier.address_hashes)}个地址，"
+                  f"{len(classifier.code_hashes)}种字节码")
+
         # 如果要重新开始
         if args.restart:
             # 创建新的输出文件，包含表头
             with open(args.output, 'w', newline='') as csvfile:
-                fieldnames = ['address'] + list(token_config.keys())
+                fieldnames = get_fieldnames(token_config, CLASSIFY_FIELDS if classifier else None)
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
                 writer.writeheader()
             
@@ -379,58 +586,59 @@ async def main():
                 progress_file.write('')
             
             print("重新开始，已清除之前的数据")
+        else:
+            # 在发出任何请求之前检查已有输出文件能否容纳本次的所有列
+            try:
+                check_output_header(args.output, get_fieldnames(token_config, CLASSIFY_FIELDS if classifier else None))
+            except ValueError as e:
+                print(e)
+                sys.exit(1)
+        
+        # 已处理地址保存在磁盘上的有序索引中，内存占用不随地址数量增长；
+        # 启动时只读入进度文件（续传模式下还有输出CSV）自上次以来新增的部分
+        sources = [args.progress_file]
+        if args.resume and not args.restart:
+            sources.append(args.output)
+        processed_addresses = ResumeIndex(f"{args.progress_file}.idx", sources)
+        processed_addresses.load()
+        print(f"找到{len(processed_addresses)}个已处理的地址")
         
-        print(f"将处理{len(valid_addresses)}个有效地址，共{len(all_addresses)}个地址")
         print(f"网络: {args.network}")
         print(f"代币: {', '.join(token_config.keys())}")
         
-        # 按批次处理地址
-        start_time = time.time()
-        
-        # 为了更好的显示进度，先计算待处理地址数量
-        pending_addresses = [addr for addr in valid_addresses if addr not in processed_addresses]
-        total_pending = len(pending_addresses)
-        
-        print(f"有{total_pending}个地址待处理")
+        # 流式读取地址文件，边读边校验、过滤，不把整个文件读入内存
+        address_stream = AddressStream(args.addresses, processed_addresses, args.error_log)
         
+        start_time = time.time()
         processed_in_session = 0
         
         # 按批次处理地址
-        for i in range(0, len(valid_addresses), BATCH_SIZE):
-            batch_addresses = valid_addresses[i:i + BATCH_SIZE]
-            
-            # 计算这个批次中有多少个地址需要处理
-            pending_in_batch = sum(1 for addr in batch_addresses if addr not in processed_addresses)
-            
-            if pending_in_batch == 0:
-                print(f"批次{i//BATCH_SIZE + 1}中的所有地址已处理，跳过")
-                continue
-                
-            print(f"处理批次{i//BATCH_SIZE + 1}/{(len(valid_addresses) + BATCH_SIZE - 1)//BATCH_SIZE}，"
-                  f"其中有{pending_in_batch}个地址待处理")
+        for batch_no, batch_addresses in enumerate(iter_batches(address_stream, BATCH_SIZE), start=1):
+            print(f"处理批次{batch_no}，其中有{len(batch_addresses)}个地址待处理")
             
             # 处理这个批次
             batch_results = await process_batch(
-                batch_addresses, rpc_manager, token_config, processed_addresses, args.output, args.progress_file
+                batch_addresses, rpc_manager, token_config, args.output, args.progress_file,
+                scanner, classifier
             )
             
-            # 更新已处理的地址
+            # 本批次的地址已写入进度文件，读入索引后地址文件中后面重复出现的同一地址会被跳过
             processed_in_session += len(batch_results)
-            for result in batch_results:
-                processed_addresses.add(result["address"])
+            processed_addresses.update()
             
-            # 进度报告
+            # 进度报告：总数未知，按已读取的文件字节数估算进度
             elapsed = time.time() - start_time
-            progress = processed_in_session / total_pending if total_pending > 0 else 1.0
+            progress = address_stream.progress()
             remaining = (elapsed / progress - elapsed) if progress > 0 else 0
             
-            print(f"本次运行已处理: {processed_in_session}/{total_pending}, "
-                  f"总进度: {len(processed_addresses)}/{len(valid_addresses)}, "
+            print(f"本次运行已处理: {processed_in_session}, 跳过已处理: {address_stream.skipped}, "
+                  f"无效地址: {address_stream.invalid}, 文件进度: {progress * 100:.1f}%, "
                   f"已用时间: {elapsed:.1f}秒, 预计剩余时间: {remaining:.1f}秒")
             
             # 短暂延迟以避免过度占用资源
             await asyncio.sleep(0.5)
         
+        processed_addresses.close()
         print(f"处理完成！结果已保存到{args.output}")
     
     finally:
@@ -1,14 +1,16 @@
 import os
 import json
-import csv
 from web3 import Web3
+from rpc_transports import make_web3_provider
+from code_classifier import CodeClassifier, EMPTY_CODE_HASH, hash_code
+from shard_store import ShardStore
 import threading
 from queue import Queue
 import time
 
 # 连接到以太坊主网
 eth = "http://192.168.31.100:8547"  # Alchemy免费节点
-web3 = Web3(Web3.HTTPProvider(eth))
+web3 = Web3(make_web3_provider(eth))  # 支持 http://、ws:// 和 IPC 路径
 
 # WETH合约地址和ABI
 WETH_ADDRESS = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
@@ -36,6 +38,25 @@ def get_weth_balance(address):
     balance = weth_contract.functions.balanceOf(address).call()
     return web3.from_wei(balance, 'ether')
 
+# 合约/EOA分类缓存，与余额在同一个工作线程中查询
+classifier = CodeClassifier('code_cache.csv')
+
+def get_code_info(address):
+    # 获取地址的合约标记和代码哈希，优先使用缓存
+    info = classifier.lookup(address)
+    if not info['code_hash']:
+        checksum_address = web3.to_checksum_address(address)
+        if classifier.method == 'eth_getProof':
+            # 不下载字节码，但响应中包含账户证明
+            code_hash = Web3.to_hex(web3.eth.get_proof(checksum_address, [])['codeHash'])
+            if int(code_hash, 16) == 0:
+                code_hash = EMPTY_CODE_HASH
+            info = classifier.record(address, code_hash, 0)
+        else:
+            code = web3.eth.get_code(checksum_address)
+            info = classifier.record(address, hash_code(Web3.to_hex(code)), len(code))
+    return info['is_contract'], info['code_hash']
+
 def worker(address_queue, result_queue):
     while True:
         try:
@@ -46,10 +67,16 @@ def worker(address_queue, result_queue):
         try:
             eth_balance = get_eth_balance(address)
             weth_balance = get_weth_balance(address)
-            result_queue.put((address, eth_balance, weth_balance))
-            print(f"地址: {address}, ETH余额: {eth_balance}, WETH余额: {weth_balance}")
+            try:
+                is_contract, code_hash = get_code_info(address)
+            except Exception as e:
+                # 分类失败不影响余额结果，留空等待下次补充
+                is_contract, code_hash = '', ''
+                print(f"获取地址 {address} 的代码信息时出错: {str(e)}")
+            result_queue.put((address, eth_balance, weth_balance, is_contract, code_hash, int(time.time())))
+            print(f"地址: {address}, ETH余额: {eth_balance}, WETH余额: {weth_balance}, 合约: {is_contract}")
         except Exception as e:
-            result_queue.put((address, 'Error', 'Error'))
+            result_queue.put((address, 'Error', 'Error', '', '', int(time.time())))
             print(f"获取地址 {address} 的余额时出错: {str(e)}")
         
         time.sleep(0.1)  # 避免请求过快
@@ -96,43 +123,33 @@ def process_json_file(json_file, progress_file):
     while not result_queue.empty():
         results.append(result_queue.get())
     
-    # 更新进度文件
-    with open(progress_file, 'a') as f:
-        for addr, _, _ in results:
-            f.write(f"{addr}\n")
+    # 保存新的代码哈希缓存
+    classifier.save()
     
-    # 读取现有的CSV文件（如果存在）
+    # 只转换本批次的新结果，不再重新读取和排序整个分片
+    # 查询出错的地址不写入分片，以免用0覆盖已有的正确余额
     csv_file = os.path.join('data', f"{os.path.splitext(os.path.basename(json_file))[0]}.csv")
-    existing_data = []
-    if os.path.exists(csv_file):
-        with open(csv_file, 'r') as f:
-            reader = csv.reader(f)
-            header = next(reader)
-            existing_data = list(reader)
-    
-    # 合并数据
-    all_data = existing_data + results
-    
-    # 转换为浮点数并排序
-    sorted_data = []
-    for row in all_data:
+    new_rows = []
+    for address, eth, weth, is_contract, code_hash, refreshed_at in results:
         try:
-            eth_balance = float(row[1]) if row[1] != 'Error' else 0.0
-            weth_balance = float(row[2]) if row[2] != 'Error' else 0.0
-            total_balance = eth_balance + weth_balance
-            sorted_data.append([row[0], eth_balance, weth_balance, total_balance])
-        except (ValueError, IndexError):
+            eth_balance = float(eth)
+            weth_balance = float(weth)
+        except ValueError:
             continue
+        new_rows.append([address, eth_balance, weth_balance, eth_balance + weth_balance, is_contract, code_hash,
+                         refreshed_at])
     
-    # 按总余额排序
-    sorted_data.sort(key=lambda x: x[3], reverse=True)
+    # 按地址upsert到分片，日志积累到一定大小后与已排序的分片线性归并
+    ShardStore(csv_file).upsert(new_rows)
     
-    # 写入CSV文件
-    with open(csv_file, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Address', 'ETH_Balance', 'WETH_Balance', 'Total_Balance'])
-        for row in sorted_data:
-            writer.writerow(row)
+    # 更新进度文件，出错的地址不记录，下次运行时重试
+    with open(progress_file, 'a') as f:
+        for row in new_rows:
+            f.write(f"{row[0]}\n")
+    
+    failed = len(results) - len(new_rows)
+    if failed:
+        print(f"文件 {json_file} 中有 {failed} 个地址查询出错，将在下次运行时重试")
     
     print(f"文件 {json_file} 处理完成，结果已保存到 {csv_file}")
 
@@ -145,6 +162,9 @@ def main():
     if not os.path.exists('progress'):
         os.makedirs('progress')
     
+    # 加载代码哈希缓存
+    classifier.load()
+    
     # 获取所有JSON文件
     json_files = [f for f in os.listdir('data') if f.endswith('.json')]
     
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from new_balance import NETWORK_CONFIGS
+from resume_index import normalize_address
+from shard_store import ShardStore, SHARD_HEADER, LOG_SUFFIX
+
+# 刷新层级配置：按余额从高到低排列
+# min_balance: 进入该层级的最低余额
+# interval: 期望的刷新间隔（秒）
+# share: 该层级保底可使用的RPC预算比例，未用完的部分按层级顺序让给其他层级
+DEFAULT_TIERS = [
+    {"name": "whale", "min_balance": 1000.0, "interval": 3600, "share": 0.4},
+    {"name": "large", "min_balance": 100.0, "interval": 6 * 3600, "share": 0.25},
+    {"name": "medium", "min_balance": 1.0, "interval": 24 * 3600, "share": 0.2},
+    {"name": "small", "min_balance": 1e-9, "interval": 7 * 24 * 3600, "share": 0.1},
+    {"name": "dust", "min_balance": 0.0, "interval": 30 * 24 * 3600, "share": 0.05},
+]
+
+# 波动率阈值：余额变化次数 / 观测次数 超过该值的地址提升一个层级
+VOLATILITY_THRESHOLD = 0.5
+# 至少观测这么多次后才计算波动率
+MIN_OBSERVATIONS = 3
+
+# 每小时RPC请求预算
+RPC_BUDGET_PER_HOUR = 100000
+
+STATE_FIELDS = ['address', 'balance', 'last_refresh', 'observations', 'changes']
+
+# 刷新结果的输出目录，默认与value/*.csv一起读回调度器
+REFRESH_DIR = 'refresh'
+
+
+# 加载层级配置，可以通过JSON文件覆盖默认配置
+def load_tiers(tiers_file: str = None) -> List[Dict[str, Any]]:
+    if not tiers_file:
+        return DEFAULT_TIERS
+    with open(tiers_file, 'r') as f:
+        tiers = json.load(f)
+    for tier in tiers:
+        for key in ('name', 'min_balance', 'interval', 'share'):
+            if key not in tier:
+                raise ValueError(f"层级配置缺少字段 {key}: {tier}")
+    # 保证按余额从高到低排列，层级下标越小优先级越高
+    return sorted(tiers, key=lambda t: t['min_balance'], reverse=True)
+
+
+# 结果文件中记录每个地址刷新时间的列（new_balance.py 和 process_json_files.py 的输出）
+REFRESHED_AT_COLUMNS = ('refreshed_at', 'Refreshed_At')
+
+
+# 默认用原生代币及其包装代币之和作为分层余额，与 value/*.csv 的 Total_Balance 口径一致
+def default_total_columns(token_config: Dict) -> List[str]:
+    native_token = next((token for token in token_config if "address" not in token_config[token]), None)
+    if native_token is None:
+        return []
+    return [token for token in (native_token, f"W{native_token}") if token in token_config]
+
+
+# 分片中的地址没有0x前缀，new_balance.py的输出带前缀，统一格式后才能对应到同一个地址
+def _iter_balances(rows: Iterator[Dict[str, str]], balance_column: str,
+                   total_columns: List[str]) -> Iterator[Tuple[str, float, Optional[float]]]:
+    for row in rows:
+        try:
+            address = normalize_address(row.get('Address') or row.get('address') or '')
+        except ValueError:
+            continue
+        try:
+            if row.get(balance_column) is not None:
+                balance = float(row[balance_column] or 0.0)
+            else:
+                # 没有总额列时（如new_balance.py的输出）按代币列求和
+                balance = sum(float(row.get(column) or 0.0) for column in total_columns)
+        except ValueError:
+            balance = 0.0
+        refreshed_at = None
+        for column in REFRESHED_AT_COLUMNS:
+            if row.get(column):
+                try:
+                    refreshed_at = float(row[column])
+                except ValueError:
+                    pass
+                break
+        yield address, balance, refreshed_at
+
+
+# 逐行读取结果文件及其未合并的更新日志，返回 (地址, 余额, 刷新时间)
+def iter_result_rows(path: str, balance_column: str,
+                     total_columns: List[str]) -> Iterator[Tuple[str, float, Optional[float]]]:
+    with open(path, 'r', newline='') as f:
+        yield from _iter_balances(csv.DictReader(f), balance_column, total_columns)
+    if os.path.exists(path + LOG_SUFFIX):
+        rows = (dict(zip(SHARD_HEADER, row)) for row in ShardStore(path).read_log())
+        yield from _iter_balances(rows, balance_column, total_columns)
+
+
+# 读取调度状态文件；旧状态文件中同一地址的不同写法合并为一条，保留最近刷新的记录
+def load_state(state_file: str) -> Dict[str, Dict[str, Any]]:
+    state = {}
+    if os.path.exists(state_file) and os.path.getsize(state_file) > 0:
+        with open(state_file, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                try:
+                    address = normalize_address(row['address'])
+                except ValueError:
+                    continue
+                entry = {
+                    'balance': float(row['balance']),
+                    'last_refresh': float(row['last_refresh']),
+                    'observations': int(row['observations']),
+                    'changes': int(row['changes']),
+                }
+                if address not in state or entry['last_refresh'] > state[address]['last_refresh']:
+                    state[address] = entry
+    return state
+
+
+# 原子写入调度状态文件
+def save_state(state: Dict[str, Dict[str, Any]], state_file: str):
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(STATE_FIELDS)
+        for address, entry in state.items():
+            writer.writerow([address, entry['balance'], entry['last_refresh'],
+                             entry['observations'], entry['changes']])
+    os.replace(tmp_file, state_file)
+
+
+# 用结果文件更新状态
+# 刷新时间取自每行的刷新时间列；文件重写（分片归并、追加输出）不会让其他地址看起来被刷新过。
+# 没有刷新时间列的旧结果只用于添加新地址，刷新时间记为未知(0)，这些地址会被优先调度
+def update_state(state: Dict[str, Dict[str, Any]], result_files: List[str], balance_column: str,
+                 total_columns: List[str]) -> int:
+    updated = 0
+    for path in result_files:
+        for address, balance, refreshed_at in iter_result_rows(path, balance_column, total_columns):
+            entry = state.get(address)
+            if entry is None:
+                state[address] = {'balance': balance, 'last_refresh': refreshed_at or 0.0,
+                                  'observations': 1, 'changes': 0}
+                updated += 1
+                continue
+            # 没有刷新时间，或者这次刷新已经记录过，跳过
+            if refreshed_at is None or refreshed_at <= entry['last_refresh']:
+                continue
+            entry['observations'] += 1
+            if balance != entry['balance']:
+                entry['changes'] += 1
+            entry['balance'] = balance
+            entry['last_refresh'] = refreshed_at
+            updated += 1
+    return updated
+
+
+# 根据余额和波动率确定地址的层级下标
+def assign_tier(entry: Dict[str, Any], tiers: List[Dict[str, Any]]) -> int:
+    tier_idx = len(tiers) - 1
+    for idx, tier in enumerate(tiers):
+        if entry['balance'] >= tier['min_balance']:
+            tier_idx = idx
+            break
+    if entry['observations'] >= MIN_OBSERVATIONS:
+        volatility = entry['changes'] / entry['observations']
+        if volatility >= VOLATILITY_THRESHOLD and tier_idx > 0:
+            tier_idx -= 1
+    return tier_idx
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(len(sorted_values) * pct))
+    return sorted_values[idx]
+
+
+# 生成优先级队列：每个层级先使用保底预算，剩余预算按层级顺序分配
+def build_queue(state: Dict[str, Dict[str, Any]], tiers: List[Dict[str, Any]], capacity: int,
+                now: float) -> Tuple[List[str], List[Dict[str, Any]]]:
+    due = [[] for _ in tiers]
+    staleness = [[] for _ in tiers]
+    unknown = [0 for _ in tiers]
+    for address, entry in state.items():
+        tier_idx = assign_tier(entry, tiers)
+        age = now - entry['last_refresh']
+        if entry['last_refresh'] > 0:
+            staleness[tier_idx].append(age)
+        else:
+            unknown[tier_idx] += 1
+        overdue = age / tiers[tier_idx]['interval']
+        if overdue >= 1.0:
+            due[tier_idx].append((overdue, address))
+
+    # 同一层级内按逾期程度从高到低排序
+    for items in due:
+        items.sort(reverse=True)
+
+    allocated = [min(len(due[idx]), int(capacity * tier['share'])) for idx, tier in enumerate(tiers)]
+    leftover = capacity - sum(allocated)
+    for idx in range(len(tiers)):
+        if leftover <= 0:
+            break
+        extra = min(len(due[idx]) - allocated[idx], leftover)
+        allocated[idx] += extra
+        leftover -= extra
+
+    queue = []
+    metrics = []
+    for idx, tier in enumerate(tiers):
+        queue.extend(address for _, address in due[idx][:allocated[idx]])
+        ages = sorted(staleness[idx])
+        metrics.append({
+            'tier': tier['name'],
+            'addresses': len(ages) + unknown[idx],
+            'unknown': unknown[idx],
+            'due': len(due[idx]),
+            'scheduled': allocated[idx],
+            'backlog': len(due[idx]) - allocated[idx],
+            'staleness_p50': _percentile(ages, 0.5),
+            'staleness_p95': _percentile(ages, 0.95),
+            'staleness_max': ages[-1] if ages else 0.0,
+            'interval': tier['interval'],
+        })
+    return queue, metrics
+
+
+# 打印每个层级的陈旧度指标，刷新时间未知的地址不计入陈旧度分位数
+def print_metrics(metrics: List[Dict[str, Any]]):
+    print(f"{'层级':<10}{'地址数':>10}{'未知':>10}{'到期':>10}{'已调度':>10}{'积压':>10}"
+          f"{'P50(时)':>10}{'P95(时)':>10}{'最大(时)':>10}")
+    for m in metrics:
+        print(f"{m['tier']:<10}{m['addresses']:>10}{m['unknown']:>10}{m['due']:>10}{m['scheduled']:>10}"
+              f"{m['backlog']:>10}"
+              f"{m['staleness_p50'] / 3600:>10.1f}{m['staleness_p95'] / 3600:>10.1f}"
+              f"{m['staleness_max'] / 3600:>10.1f}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='按余额层级生成地址刷新队列')
+    parser.add_argument('--results', type=str, nargs='+', default=['value/*.csv', f'{REFRESH_DIR}/*.csv'],
+                      help=f'历史结果CSV文件，支持通配符 (默认: value/*.csv {REFRESH_DIR}/*.csv)')
+    parser.add_argument('--balance-column', type=str, default='Total_Balance',
+                      help='用于分层的余额列，不存在时按--total-columns求和 (默认: Total_Balance)')
+    parser.add_argument('--total-columns', type=str, nargs='+', default=None,
+                      help='没有余额列时求和的代币列 (默认: 原生代币及其包装代币，如 ETH WETH)')
+    parser.add_argument('--state-file', type=str, default='refresh_state.csv',
+                      help='调度状态文件的路径 (默认: refresh_state.csv)')
+    parser.add_argument('--tiers', type=str, default=None,
+                      help='层级配置JSON文件，覆盖默认层级')
+    parser.add_argument('--network', type=str, default='ethereum',
+                      choices=NETWORK_CONFIGS.keys(),
+                      help='用于估算每个地址RPC请求数的网络 (默认: ethereum)')
+    parser.add_argument('--rpc-budget', type=int, default=RPC_BUDGET_PER_HOUR,
+                      help=f'每小时RPC请求预算 (默认: {RPC_BUDGET_PER_HOUR})')
+    parser.add_argument('--window', type=int, default=3600,
+                      help='本次调度覆盖的时间窗口，单位秒 (默认: 3600)')
+    parser.add_argument('--output', type=str, default='refresh_queue.txt',
+                      help='输出队列文件，可直接作为new_balance.py的--addresses；'
+                           'new_balance.py总会跳过进度文件中的地址，刷新时需使用单独的--output和--progress-file '
+                           '(默认: refresh_queue.txt)')
+    parser.add_argument('--metrics', type=str, default=None,
+                      help='将层级指标写入JSON文件')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    tiers = load_tiers(args.tiers)
+
+    result_files = []
+    for pattern in args.results:
+        result_files.extend(sorted(glob.glob(pattern)))
+    if not result_files:
+        print("没有找到结果文件")
+        sys.exit(1)
+
+    token_config = NETWORK_CONFIGS[args.network]["tokens"]
+    total_columns = args.total_columns or default_total_columns(token_config)
+
+    state = load_state(args.state_file)
+    updated = update_state(state, result_files, args.balance_column, total_columns)
+    save_state(state, args.state_file)
+    print(f"读取了{len(result_files)}个结果文件，更新了{updated}个地址，共{len(state)}个地址")
+
+    # 每个地址需要一次原生余额请求加上每个代币一次eth_call
+    calls_per_address = len(token_config)
+    capacity = args.rpc_budget * args.window // 3600 // calls_per_address
+
+    queue, metrics = build_queue(state, tiers, capacity, time.time())
+
+    with open(args.output, 'w') as f:
+        for address in queue:
+            f.write(f"{address}\n")
+
+    print(f"预算可刷新{capacity}个地址，已调度{len(queue)}个，队列已保存到{args.output}")
+    # 每次刷新使用新的输出和进度文件：new_balance.py会跳过进度文件中已有的地址，
+    # 而--restart会清空输出文件；输出写到刷新目录，下次调度时默认读回
+    os.makedirs(REFRESH_DIR, exist_ok=True)
+    run_id = time.strftime('%Y%m%d%H%M%S')
+    print(f"刷新命令: python new_balance.py --network {args.network} --addresses {args.output} "
+          f"--output {REFRESH_DIR}/{run_id}.csv --progress-file {REFRESH_DIR}/{run_id}_progress.txt")
+    print_metrics(metrics)
+
+    if args.metrics:
+        with open(args.metrics, 'w') as f:
+            json.dump(metrics, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+import glob
+import heapq
+import json
+import mmap
+import os
+from typing import Dict, Iterator, List
+
+KEY_SIZE = 20  # 地址的20字节二进制形式
+
+
+def address_key(address: str) -> bytes:
+    address = address.strip().lower()
+    if address.startswith('0x'):
+        address = address[2:]
+    return bytes.fromhex(address)
+
+
+# 统一地址格式为 0x + 40位小写十六进制，无效地址抛出ValueError
+def normalize_address(address: str) -> str:
+    key = address_key(address)
+    if len(key) != KEY_SIZE:
+        raise ValueError(f"无效地址: {address}")
+    return '0x' + key.hex()
+
+
+def _iter_run(path: str) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            key = f.read(KEY_SIZE)
+            if len(key) < KEY_SIZE:
+                return
+            yield key
+
+
+# 已处理地址的磁盘索引
+# 地址以20字节二进制键保存在若干个有序的run文件中，清单文件记录这些run以及每个来源文件（进度文件、
+# 续传时的输出CSV）已经读到的字节位置。启动时只读取来源文件新增的部分，不会重建整个索引；
+# 运行中调用update()读入新写入进度文件的地址，用于跳过地址文件中的重复地址。
+# 新地址先放在内存缓冲中，缓冲满后写成一个新的run，大小相近的run按层级归并，run数量保持在对数级。
+# 查询时先查缓冲和持久化的布隆过滤器，命中后再在各个run上二分查找确认；
+# 内存占用只取决于缓冲和布隆过滤器大小，与地址数量无关
+class ResumeIndex:
+    def __init__(self, index_file: str, sources: List[str], buffer_size: int = 100000,
+                 bloom_bytes: int = 16 * 1024 * 1024, bloom_hashes: int = 3):
+        self.index_file = index_file
+        self.bloom_file = f"{index_file}.bloom"
+        self.sources = sources
+        self.buffer_size = buffer_size
+        self.bloom_bytes = bloom_bytes
+        self.bloom_bits = bloom_bytes * 8
+        self.bloom_hashes = bloom_hashes
+        self.bloom = bytearray(bloom_bytes)
+        # 每个run为 {'file': 文件名, 'count': 地址数}，从旧到新排列
+        self.runs: List[Dict] = []
+        self.offsets: Dict[str, int] = {}
+        self.next_run = 0
+        self.buffer = set()
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._files = {}
+
+    # 加载已有索引；来源文件被截断（如--restart）、来源变化或参数不同时丢弃旧索引重新开始
+    def load(self):
+        manifest = None
+        if os.path.exists(self.index_file) and os.path.exists(self.bloom_file):
+            try:
+                with open(self.index_file, 'r') as f:
+                    manifest = json.load(f)
+            except (ValueError, OSError):
+                manifest = None
+        if manifest and self._manifest_valid(manifest):
+            self.runs = manifest['runs']
+            self.offsets = manifest['offsets']
+            self.next_run = manifest['next_run']
+            with open(self.bloom_file, 'rb') as f:
+                self.bloom = bytearray(f.read())
+        else:
+            self.runs = []
+            self.offsets = {}
+            self.next_run = 0
+            self.bloom = bytearray(self.bloom_bytes)
+        self._remove_orphan_runs()
+        for run in self.runs:
+            self._open_run(run['file'])
+        self.update()
+
+    def _manifest_valid(self, manifest: Dict) -> bool:
+        if manifest.get('bloom_bytes') != self.bloom_bytes or manifest.get('bloom_hashes') != self.bloom_hashes:
+            return False
+        offsets = manifest.get('offsets', {})
+        # 旧索引中包含本次未使用的来源，其中的地址不应再被跳过
+        if any(path not in self.sources for path in offsets):
+            return False
+        for path, offset in offsets.items():
+            if not os.path.exists(path) or os.path.getsize(path) < offset:
+                return False
+        return all(os.path.exists(run['file']) for run in manifest.get('runs', []))
+
+    # 删除中断时留下的、不在清单中的run文件
+    def _remove_orphan_runs(self):
+        listed = {run['file'] for run in self.runs}
+        for path in glob.glob(f"{glob.escape(self.index_file)}.run*"):
+            if path not in listed:
+                os.remove(path)
+
+    # 读入来源文件自上次以来新增的完整行；每行取第一个逗号前的内容，无效地址（如CSV表头）被忽略
+    def update(self):
+        for path in self.sources:
+            if not os.path.exists(path):
+                continue
+            offset = self.offsets.get(path, 0)
+            if os.path.getsize(path) <= offset:
+                continue
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # 尚未写完的行留到下次读取
+                    offset += len(line)
+                    try:
+                        key = address_key(line.split(b',', 1)[0].decode('ascii'))
+                    except (ValueError, UnicodeDecodeError):
+                        continue
+                    if len(key) != KEY_SIZE:
+                        continue
+                    self.buffer.add(key)
+                    if len(self.buffer) >= self.buffer_size:
+                        self.offsets[path] = offset
+                        self._flush()
+            self.offsets[path] = offset
+
+    # 将缓冲写成新的有序run，归并大小相近的run，然后保存布隆过滤器和清单
+    def _flush(self):
+        if self.buffer:
+            run_file = self._new_run_file()
+            with open(run_file, 'wb') as f:
+                for key in sorted(self.buffer):
+                    f.write(key)
+                    self._bloom_add(key)
+            self.runs.append({'file': run_file, 'count': len(self.buffer)})
+            self._open_run(run_file)
+            self.buffer = set()
+            while len(self.runs) >= 2 and self.runs[-1]['count'] * 2 >= self.runs[-2]['count']:
+                self._merge_last_two()
+        self._save_manifest()
+
+    def _new_run_file(self) -> str:
+        run_file = f"{self.index_file}.run{self.next_run}"
+        self.next_run += 1
+        return run_file
+
+    def _merge_last_two(self):
+        older, newer = self.runs[-2], self.runs[-1]
+        run_file = self._new_run_file()
+        count = 0
+        previous = None
+        with open(run_file, 'wb') as f:
+            for key in heapq.merge(_iter_run(older['file']), _iter_run(newer['file'])):
+                if key == previous:
+                    continue
+                f.write(key)
+                count += 1
+                previous = key
+        self.runs[-2:] = [{'file': run_file, 'count': count}]
+        self._open_run(run_file)
+        # 清单更新前旧run仍被引用，保存清单后再删除
+        self._save_manifest()
+        for run in (older, newer):
+            self._close_run(run['file'])
+            os.remove(run['file'])
+
+    def _save_manifest(self):
+        tmp_file = f"{self.bloom_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(self.bloom)
+        os.replace(tmp_file, self.bloom_file)
+        manifest = {'runs': self.runs, 'offsets': self.offsets, 'next_run': self.next_run,
+                    'bloom_bytes': self.bloom_bytes, 'bloom_hashes': self.bloom_hashes}
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_file, self.index_file)
+
+    # 保存缓冲中的地址并关闭所有run
+    def close(self):
+        self._flush()
+        for path in list(self._maps):
+            self._close_run(path)
+
+    def _open_run(self, path: str):
+        if os.path.getsize(path) == 0:
+            return
+        self._files[path] = open(path, 'rb')
+        self._maps[path] = mmap.mmap(self._files[path].fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close_run(self, path: str):
+        if path in self._maps:
+            self._maps.pop(path).close()
+            self._files.pop(path).close()
+
+    def _bloom_positions(self, key: bytes) -> Iterator[int]:
+        # 地址本身来自哈希，直接取不同的字节段作为哈希值
+        for i in range(self.bloom_hashes):
+            yield int.from_bytes(key[i * 6:i * 6 + 6], 'big') % self.bloom_bits
+
+    def _bloom_add(self, key: bytes):
+        for pos in self._bloom_positions(key):
+            self.bloom[pos >> 3] |= 1 << (pos & 7)
+
+    def _bloom_check(self, key: bytes) -> bool:
+        return all(self.bloom[pos >> 3] & (1 << (pos & 7)) for pos in self._bloom_positions(key))
+
+    def _run_contains(self, run: Dict, key: bytes) -> bool:
+        data = self._maps.get(run['file'])
+        if data is None:
+            return False
+        lo, hi = 0, run['count']
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = mid * KEY_SIZE
+            current = data[offset:offset + KEY_SIZE]
+            if current == key:
+                return True
+            if current < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return False
+
+    # 地址数量（不同run之间可能有少量重复，归并后去除）
+    def __len__(self) -> int:
+        return sum(run['count'] for run in self.runs) + len(self.buffer)
+
+    def __contains__(self, address: str) -> bool:
+        try:
+            key = address_key(address)
+        except ValueError:
+            return False
+        if key in self.buffer:
+            return True
+        if not self.runs or not self._bloom_check(key):
+            return False
+        return any(self._run_contains(run, key) for run in reversed(self.runs))
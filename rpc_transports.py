@@ -0,0 +1,277 @@
+import asyncio
+import codecs
+import itertools
+import json
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Tuple, Union
+
+import aiohttp
+from web3 import Web3
+
+# 节点配置既可以是URL字符串，也可以是 {"url": ..., "transport": "http" | "ws" | "ipc"}
+# 未指定transport时按URL判断：http(s):// 为HTTP，ws(s):// 为WebSocket，ipc:// 或本地路径为IPC
+NodeConfig = Union[str, Dict[str, str]]
+
+
+class TransportError(Exception):
+    pass
+
+
+def parse_node(node: NodeConfig) -> Tuple[str, str]:
+    if isinstance(node, dict):
+        url = node["url"]
+        transport = node.get("transport")
+    else:
+        url = node
+        transport = None
+
+    if transport is None:
+        if url.startswith(("ws://", "wss://")):
+            transport = "ws"
+        elif url.startswith("ipc://") or url.startswith("/") or url.endswith(".ipc"):
+            transport = "ipc"
+        else:
+            transport = "http"
+
+    if transport == "ipc" and url.startswith("ipc://"):
+        url = url[len("ipc://"):]
+    if transport not in ("http", "ws", "ipc"):
+        raise ValueError(f"不支持的传输方式: {transport}")
+    return transport, url
+
+
+# HTTP传输：每个请求一次POST，连接由aiohttp连接池复用
+class HTTPTransport:
+    def __init__(self, url: str, max_connections: int = 100):
+        self.url = url
+        self.max_connections = max_connections
+        self.session = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(connector=connector)
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    # 返回 (HTTP状态码, 解析后的JSON)
+    async def send(self, payload: Any) -> Tuple[int, Any]:
+        async with self.session.post(self.url, json=payload) as response:
+            if response.status != 200:
+                return response.status, None
+            return response.status, await response.json()
+
+
+# 持久连接上的流水线传输：请求id在本地重新分配，多个请求共用一个连接，响应按id分发
+class PipelinedTransport(ABC):
+    def __init__(self, url: str, timeout: float = 60):
+        self.url = url
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        # 按写入顺序记录每条消息（单个请求或批量请求）包含的请求id
+        self._messages: Dict[int, List[int]] = {}
+        self._reader_task = None
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+
+    @abstractmethod
+    async def _connect(self):
+        pass
+
+    @abstractmethod
+    async def _write(self, data: str):
+        pass
+
+    @abstractmethod
+    def _read_messages(self) -> AsyncIterator[Dict]:
+        # 子类实现为异步生成器，逐条产出收到的JSON消息
+        pass
+
+    @abstractmethod
+    async def _disconnect(self):
+        pass
+
+    @property
+    def connected(self) -> bool:
+        return self._reader_task is not None and not self._reader_task.done()
+
+    async def start(self):
+        async with self._connect_lock:
+            if not self.connected:
+                await self._connect()
+                self._reader_task = asyncio.create_task(self._reader_loop())
+
+    async def close(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await self._disconnect()
+
+    async def _reader_loop(self):
+        error = TransportError(f"连接已断开: {self.url}")
+        try:
+            async for message in self._read_messages():
+                for item in (message if isinstance(message, list) else [message]):
+                    if item.get("id") is None and "error" in item:
+                        self._fail_message(item)
+                        continue
+                    future = self._pending.pop(item.get("id"), None)
+                    if future and not future.done():
+                        future.set_result(item)
+        except Exception as e:
+            error = TransportError(f"读取响应出错: {e}")
+        finally:
+            # 连接断开时让所有等待中的请求失败，下一次发送时重新连接
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._pending.clear()
+
+    # 节点拒绝整条消息时返回id为null的单个错误，无法按id分发；
+    # 连接上的消息按顺序处理，该错误属于最早写入、还没有收到任何响应的那条消息
+    def _fail_message(self, item: Dict):
+        for message_key, ids in self._messages.items():
+            if all(request_id in self._pending for request_id in ids):
+                del self._messages[message_key]
+                for request_id in ids:
+                    future = self._pending.pop(request_id)
+                    if not future.done():
+                        future.set_result(dict(item, id=request_id))
+                return
+
+    async def send(self, payload: Any) -> Tuple[int, Any]:
+        if not self.connected:
+            await self.start()
+
+        loop = asyncio.get_running_loop()
+        is_batch = isinstance(payload, list)
+        requests = payload if is_batch else [payload]
+        original_ids = []
+        futures = []
+        rewritten = []
+        for request in requests:
+            request_id = next(self._ids)
+            future = loop.create_future()
+            self._pending[request_id] = future
+            original_ids.append(request.get("id"))
+            futures.append(future)
+            rewritten.append(dict(request, id=request_id))
+
+        message_key = next(self._ids)
+        try:
+            async with self._write_lock:
+                self._messages[message_key] = [request["id"] for request in rewritten]
+                await self._write(json.dumps(rewritten if is_batch else rewritten[0]))
+            responses = await asyncio.wait_for(asyncio.gather(*futures), self.timeout)
+        except Exception:
+            for request in rewritten:
+                self._pending.pop(request["id"], None)
+            raise
+        finally:
+            self._messages.pop(message_key, None)
+
+        # 恢复调用方的请求id
+        responses = [dict(response, id=original_id) for response, original_id in zip(responses, original_ids)]
+        return 200, responses if is_batch else responses[0]
+
+
+# Unix域套接字IPC传输，节点以拼接的JSON文本返回响应
+class IPCTransport(PipelinedTransport):
+    def __init__(self, path: str, read_size: int = 65536):
+        super().__init__(path)
+        self.read_size = read_size
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.url, limit=self.read_size)
+
+    async def _write(self, data: str):
+        self.writer.write(data.encode())
+        await self.writer.drain()
+
+    async def _read_messages(self):
+        decoder = json.JSONDecoder()
+        text_decoder = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        while True:
+            chunk = await self.reader.read(self.read_size)
+            if not chunk:
+                return
+            buffer += text_decoder.decode(chunk)
+            # 大响应会分多次到达，只有在可能是消息结尾时才尝试解析，避免反复扫描缓冲区
+            if not buffer.rstrip().endswith(("}", "]")):
+                continue
+            while True:
+                buffer = buffer.lstrip()
+                if not buffer:
+                    break
+                try:
+                    message, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    break  # 消息尚未接收完整
+                buffer = buffer[end:]
+                yield message
+
+    async def _disconnect(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+
+
+# WebSocket传输，每个请求是一个文本帧
+class WebSocketTransport(PipelinedTransport):
+    def __init__(self, url: str):
+        super().__init__(url)
+        self.session = None
+        self.ws = None
+
+    async def _connect(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        self.ws = await self.session.ws_connect(self.url, max_msg_size=0, autoping=True)
+
+    async def _write(self, data: str):
+        await self.ws.send_str(data)
+
+    async def _read_messages(self):
+        async for msg in self.ws:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                yield json.loads(msg.data)
+            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                return
+
+    async def _disconnect(self):
+        if self.ws:
+            await self.ws.close()
+        if self.session:
+            await self.session.close()
+
+
+def create_transport(node: NodeConfig, max_connections: int = 100):
+    transport, url = parse_node(node)
+    if transport == "ipc":
+        return IPCTransport(url)
+    if transport == "ws":
+        return WebSocketTransport(url)
+    return HTTPTransport(url, max_connections)
+
+
+# 为同步脚本创建对应的web3 provider
+def make_web3_provider(node: NodeConfig):
+    transport, url = parse_node(node)
+    if transport == "ipc":
+        return Web3.IPCProvider(url)
+    if transport == "ws":
+        # web3 v7 将同步WebSocket provider改名为LegacyWebSocketProvider
+        provider_class = getattr(Web3, "LegacyWebSocketProvider", None) or Web3.WebsocketProvider
+        return provider_class(url)
+    return Web3.HTTPProvider(url)
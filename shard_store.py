@@ -0,0 +1,91 @@
+import csv
+import heapq
+import os
+from typing import List, Dict, Iterator
+
+SHARD_HEADER = ['Address', 'ETH_Balance', 'WETH_Balance', 'Total_Balance', 'Is_Contract', 'Code_Hash',
+                'Refreshed_At']
+
+# 更新日志文件后缀，日志中每行是一条upsert记录，同一地址以最后一条为准
+LOG_SUFFIX = '.log'
+
+
+def _total(row: List[str]) -> float:
+    try:
+        return float(row[3])
+    except (ValueError, IndexError):
+        return 0.0
+
+
+# 按总余额降序排列的分片CSV存储
+# upsert只追加到日志文件，成本与变更行数成正比；日志超过分片大小的一定比例时，
+# 将日志按余额排序后与分片做一次线性归并，写入临时文件再原子替换
+class ShardStore:
+    def __init__(self, csv_file: str, compaction_ratio: float = 0.1):
+        self.csv_file = csv_file
+        self.log_file = csv_file + LOG_SUFFIX
+        self.compaction_ratio = compaction_ratio
+
+    def upsert(self, rows: List[List]):
+        if not rows:
+            return
+        with open(self.log_file, 'a', newline='') as f:
+            writer = csv.writer(f)
+            for row in rows:
+                writer.writerow(row)
+        if self.needs_compaction():
+            self.compact()
+
+    def needs_compaction(self) -> bool:
+        if not os.path.exists(self.log_file):
+            return False
+        shard_size = os.path.getsize(self.csv_file) if os.path.exists(self.csv_file) else 0
+        return os.path.getsize(self.log_file) > shard_size * self.compaction_ratio
+
+    # 读取日志中的最新记录，按地址去重后按余额降序排列
+    def read_log(self) -> List[List[str]]:
+        if not os.path.exists(self.log_file):
+            return []
+        updates: Dict[str, List[str]] = {}
+        with open(self.log_file, 'r', newline='') as f:
+            for row in csv.reader(f):
+                # 跳过中断写入导致的不完整行
+                if len(row) < 4:
+                    continue
+                try:
+                    float(row[3])
+                except ValueError:
+                    continue
+                updates[row[0].lower()] = row
+        return sorted(updates.values(), key=_total, reverse=True)
+
+    def _iter_shard(self, skip: Dict[str, List[str]]) -> Iterator[List[str]]:
+        if not os.path.exists(self.csv_file):
+            return
+        with open(self.csv_file, 'r', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)  # 跳过表头
+            for row in reader:
+                if row and row[0].lower() not in skip:
+                    yield row
+
+    # 分片与日志合并后的视图，按总余额降序
+    def iter_rows(self) -> Iterator[List[str]]:
+        updates = self.read_log()
+        skip = {row[0].lower(): row for row in updates}
+        for row in heapq.merge(self._iter_shard(skip), updates, key=lambda r: -_total(r)):
+            yield row + [''] * (len(SHARD_HEADER) - len(row))
+
+    # 将日志归并进分片：分片已按余额排序，只需对日志排序后线性归并
+    def compact(self):
+        if not os.path.exists(self.log_file):
+            return
+        tmp_file = f"{self.csv_file}.tmp"
+        with open(tmp_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(SHARD_HEADER)
+            for row in self.iter_rows():
+                writer.writerow(row)
+        os.replace(tmp_file, self.csv_file)
+        # 替换完成后再删除日志；如果在两步之间中断，重放日志的结果相同
+        os.remove(self.log_file)